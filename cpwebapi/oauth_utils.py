@@ -1,25 +1,41 @@
-from Crypto.PublicKey import RSA
-from Crypto.Signature import PKCS1_v1_5 as PKCS1_v1_5_Signature
-from Crypto.Cipher import PKCS1_v1_5 as PKCS1_v1_5_Cipher
-from Crypto.Hash import SHA256, HMAC, SHA1
 from urllib import parse
+import asyncio
+import concurrent.futures
 import string
-import random
+import secrets
 import base64
+import hashlib
+import hmac
 import dataclasses
+import functools
+import itertools
+import operator
 import os
+from typing import Callable, Iterable, Union
 from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives import serialization, hashes
+from cryptography.hazmat.primitives.asymmetric import dh, padding, rsa
+
+STRING_ENCODING = "utf-8"
+INT_BASE = 16
+NONCE_LENGTH = 32
+NONCE_CHARACTERS = string.ascii_letters + string.digits
+DH_RANDOM_BYTE_COUNT = 256 // 8
 
 
 # Function to read and parse a PEM file containing DH parameters
-def read_and_parse_dh_pem_file(filepath: os.PathLike):
+@functools.lru_cache(maxsize=4)
+def read_and_parse_dh_pem_file(filepath: os.PathLike) -> tuple[dh.DHParameters, int]:
+    """
+    Reads the DH parameters from the PEM file path provided. Returns the parameters together with the
+    DH prime as an int, so callers can hold on to the prime without parsing it again.
+    """
     with open(filepath, 'rb') as file:
         pem_data = file.read()
 
     # Load the DH parameters using the cryptography library
     dh_params = serialization.load_pem_parameters(pem_data, backend=default_backend())
-    return dh_params
+    return dh_params, dh_params.parameter_numbers().p
 
 @dataclasses.dataclass
 class OAuthConfig:
@@ -31,6 +47,17 @@ class OAuthConfig:
     access_token: str
     access_token_secret: str
     is_test: bool = False
+    nonce: Callable[[], str] = dataclasses.field(init=False, repr=False, compare=False)
+    dh_random: Callable[[], str] = dataclasses.field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # Pick the nonce and DH random generators once, so the request path does not need to check is_test
+        if self.is_test:
+            self.nonce = _generate_test_oauth_nonce
+            self.dh_random = _generate_test_dh_random_bytes
+        else:
+            self.nonce = _generate_oauth_nonce
+            self.dh_random = _generate_dh_random_bytes
 
 
 def oauth_config_hook(config_data: dict[str, str]) -> OAuthConfig:
@@ -40,27 +67,36 @@ def oauth_config_hook(config_data: dict[str, str]) -> OAuthConfig:
     return OAuthConfig(**config_data)
 
 
-def read_private_key(private_key_fp: str) -> RSA.RsaKey:
+@functools.lru_cache(maxsize=4)
+def read_private_key(private_key_fp: str) -> rsa.RSAPrivateKey:
     """
     Reads the private key from the file path provided. The key is used to sign the request and decrypt the access token secret.
     """
-    FILE_MODE = "r"
+    FILE_MODE = "rb"
     with open(private_key_fp, FILE_MODE) as f:
-        private_key = RSA.importKey(f.read())
+        private_key = serialization.load_pem_private_key(
+            f.read(), password=None, backend=default_backend()
+        )
     return private_key
 
 
+def _generate_test_oauth_nonce() -> str:
+    return NONCE_CHARACTERS[:NONCE_LENGTH]
+
+
+def _generate_oauth_nonce() -> str:
+    return "".join(secrets.choice(NONCE_CHARACTERS) for _ in range(NONCE_LENGTH))
+
+
 def generate_oauth_nonce(is_test: bool) -> str:
     """
-    Generates a random nonce value. A unique nonce value is generated for each request.
+    Generates a random nonce value. A unique nonce value is generated for each request using a cryptographically
+    secure random source.
     """
-    NONCE_LENGTH = 32
-    NONCE_CHARACTERS = string.ascii_letters + string.digits
-
     if is_test:
-        return NONCE_CHARACTERS[:NONCE_LENGTH]
-    
-    return "".join(random.choice(NONCE_CHARACTERS) for _ in range(NONCE_LENGTH))
+        return _generate_test_oauth_nonce()
+
+    return _generate_oauth_nonce()
 
 
 def generate_base_string(
@@ -81,12 +117,14 @@ def generate_base_string(
     LIST_SEPARATOR = "&"
     KEY_VALUE_SEPARATOR = "="
     encoded_request_url = parse.quote_plus(request_url)
-    # Create a dictionary of any header, params, form data or body data that is not None
-    base_string_params = {**request_headers}
-    base_string_params.update(params or {})
-    base_string_params.update(form_data or {})
-    base_string_params.update(body or {})
-    base_string_params.update(extra_headers or {})
+    # Create a dictionary of any header, params, form data or body data that is not None, later sources take precedence
+    base_string_params = dict(
+        itertools.chain.from_iterable(
+            source.items()
+            for source in (request_headers, params, form_data, body, extra_headers)
+            if source
+        )
+    )
     oauth_params_string = LIST_SEPARATOR.join(
         [f"{k}{KEY_VALUE_SEPARATOR}{v}" for k, v in sorted(base_string_params.items())]
     )
@@ -99,101 +137,146 @@ def generate_base_string(
     return base_string
 
 
+def _generate_test_dh_random_bytes() -> str:
+    bytes_array = bytearray(range(DH_RANDOM_BYTE_COUNT))
+    hex_string = ''.join(f'{b:02x}' for b in bytes_array)
+    return hex_string
+
+
+def _generate_dh_random_bytes() -> str:
+    return secrets.token_hex(DH_RANDOM_BYTE_COUNT)
+
+
 def generate_dh_random_bytes(is_test: bool) -> str:
     """
     Generates a random 256 bit number and returns it as a hex value. This is used when generating the DH challenge.
     """
-    NUM_RANDOM_BITS = 256
-    # 
-    # random_bytes = bytearray(BYTE_COUNT)
-
     if is_test:
-        BYTE_COUNT = NUM_RANDOM_BITS // 8
-        bytes_array = bytearray(range(BYTE_COUNT))
-        hex_string = ''.join(f'{b:02x}' for b in bytes_array)
-        return hex_string
+        return _generate_test_dh_random_bytes()
 
-    random_bytes = random.getrandbits(NUM_RANDOM_BITS)
-    random_bytes_hex = hex(random_bytes)[2:]
-    return random_bytes_hex
+    return _generate_dh_random_bytes()
 
 
 def generate_dh_challenge(dh_prime: int, dh_random: str, dh_generator: int = 2) -> str:
     """
     Generate the DH challenge using the prime, random and generator values. The result needs to be recorded as a hex value and sent to LST endpoint.
     """
-    INT_BASE = 16
+    # The built-in pow is used on purpose: cryptography cannot derive a DH key pair from a caller supplied exponent,
+    # and DHPrivateNumbers.private_key() re-validates the prime, which costs more than this exponentiation.
     dh_challenge = pow(dh_generator, int(dh_random, INT_BASE), dh_prime)
     hex_challenge = hex(dh_challenge)[2:]
     return hex_challenge
 
 
 def calculate_live_session_token_prepend(
-    access_token_secret: str, private_encryption_key: RSA.RsaKey
+    access_token_secret: str, private_encryption_key: rsa.RSAPrivateKey
 ) -> str:
     """
     Decrypts the access token secret using the private encryption key. The result is then converted to a hex value, and returned as the prepend
     used when requesting the live session token.
     """
     access_token_secret_bytes = base64.b64decode(access_token_secret)
-    cipher = PKCS1_v1_5_Cipher.new(private_encryption_key)
-    decrypted_access_token_secret = cipher.decrypt(access_token_secret_bytes, None)
+    decrypted_access_token_secret = private_encryption_key.decrypt(
+        access_token_secret_bytes, padding.PKCS1v15()
+    )
     decrypted_access_token_secret_hex = decrypted_access_token_secret.hex()
     return decrypted_access_token_secret_hex
 
 
 def generate_rsa_sha_256_signature(
-    base_string: str, private_signature_key: RSA.RsaKey
+    base_string: str, private_signature_key: rsa.RSAPrivateKey
 ) -> str:
     """
     Generates the signature for the base string using the private signature key. The signature is generated using the
-    RSA-SHA256 algorithm and is encoded using base64. The signature is then decoded to utf-8 and the newline character
-    is removed. Finally, the signature is URL encoded.
+    RSA-SHA256 algorithm and is encoded using base64 without line breaks. Finally, the signature is URL encoded.
 
     This method is used when getting the request, access and live session tokens.
     """
-    STRING_ENCODING = "utf-8"
     encoded_base_string = base_string.encode(STRING_ENCODING)
-    signer = PKCS1_v1_5_Signature.new(private_signature_key)
-    hash = SHA256.new(encoded_base_string)
-    signature = signer.sign(hash)
-    encoded_signature = base64.encodebytes(signature)
-    return parse.quote_plus(encoded_signature.decode(STRING_ENCODING).replace("\n", ""))
+    signature = private_signature_key.sign(
+        encoded_base_string, padding.PKCS1v15(), hashes.SHA256()
+    )
+    encoded_signature = base64.b64encode(signature)
+    return parse.quote_plus(encoded_signature)
 
 
-def generate_hmac_sha_256_signature(base_string: str, live_session_token: str) -> str:
+async def sign_request_async(
+    base_string: str, private_signature_key: rsa.RSAPrivateKey
+) -> str:
+    """
+    Generates the RSA-SHA256 signature for the base string in a worker thread, so the event loop is not blocked
+    while the private key operation runs.
+    """
+    return await asyncio.to_thread(
+        generate_rsa_sha_256_signature, base_string, private_signature_key
+    )
+
+
+def sign_many(
+    base_strings: Iterable[str],
+    private_signature_key: rsa.RSAPrivateKey,
+    max_workers: int = None,
+) -> list[str]:
+    """
+    Generates the RSA-SHA256 signatures for a batch of base strings using a thread pool. The signatures are returned
+    in the same order as the base strings. By default one worker is used per CPU.
+    """
+    sign = functools.partial(
+        generate_rsa_sha_256_signature, private_signature_key=private_signature_key
+    )
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_workers or os.cpu_count()
+    ) as executor:
+        return list(executor.map(sign, base_strings))
+
+
+class HmacSigner:
+    """
+    Signs base strings with HMAC-SHA256 using the live session token. The keyed HMAC state is prepared once and copied
+    for every request, so the same signer can be reused for as long as the live session token is valid.
+    """
+
+    def __init__(self, live_session_token: str):
+        self.live_session_token = live_session_token
+        self._template = hmac.new(
+            base64.b64decode(live_session_token), None, hashlib.sha256
+        )
+
+    def sign(self, base_string: str) -> str:
+        hmac_obj = self._template.copy()
+        hmac_obj.update(base_string.encode(STRING_ENCODING))
+        return parse.quote_plus(base64.b64encode(hmac_obj.digest()))
+
+
+def generate_hmac_sha_256_signature(
+    base_string: str, live_session_token: Union[str, HmacSigner]
+) -> str:
     """
     When accessing any other endpoint, which means any protected resource, the key used is the live session token as a byte array and the signature
-    method is HMAC-SHA256.
+    method is HMAC-SHA256. Pass an HmacSigner instead of the raw live session token to reuse the keyed HMAC state across requests.
     """
-    STRING_ENCODING = "utf-8"
+    if isinstance(live_session_token, HmacSigner):
+        return live_session_token.sign(base_string)
     encoded_base_string = base_string.encode(STRING_ENCODING)
-    hmac = HMAC.new(bytes(base64.b64decode(live_session_token)), digestmod=SHA256)
-    hmac.update(encoded_base_string)
-    return parse.quote_plus(base64.b64encode(hmac.digest()).decode(STRING_ENCODING))
+    key = base64.b64decode(live_session_token)
+    digest = hmac.digest(key, encoded_base_string, hashlib.sha256)
+    return parse.quote_plus(base64.b64encode(digest))
 
 
-def get_access_token_secret_bytes(access_token_secret: str) -> list[int]:
+def get_access_token_secret_bytes(access_token_secret: str) -> bytes:
     """
     Converts the access token secret to a byte array. This is used when generating the live session token.
     """
-    access_token_secret_bytes = bytearray.fromhex(access_token_secret)
-    return [int(byte) for byte in access_token_secret_bytes]
+    return bytes.fromhex(access_token_secret)
 
 
-def to_byte_array(x: int) -> list[int]:
+def to_byte_array(x: int) -> bytes:
     """
-    Converts an integer to a byte array. This is used when generating the live session token.
+    Converts an integer to a big-endian byte array. A leading zero byte is added when the most significant bit is set,
+    matching the two's complement representation expected by the API. This is used when generating the live session token.
     """
-    hex_string = hex(x)[2:]
-    if len(hex_string) % 2 > 0:
-        hex_string = "0" + hex_string
-    byte_array = []
-    if len(bin(x)[2:]) % 8 == 0:
-        byte_array.append(0)
-    for i in range(0, len(hex_string), 2):
-        byte_array.append(int(hex_string[i : i + 2], 16))
-    return byte_array
+    BYTE_ORDER = "big"
+    return x.to_bytes(x.bit_length() // 8 + 1, BYTE_ORDER)
 
 
 def calculate_live_session_token(
@@ -203,15 +286,12 @@ def calculate_live_session_token(
     Calculates the live session token using the DH prime, random value, response and prepend.
     The live session token is used to sign requests for protected resources.
     """
-    INT_BASE = 16
-    STRING_ENCODING = "utf-8"
     access_token_secret_bytes = get_access_token_secret_bytes(prepend)
     a = int(dh_random_value, INT_BASE)
     B = int(dh_response, INT_BASE)
     K = pow(B, a, dh_prime)
-    hmac = HMAC.new(bytes(to_byte_array(K)), digestmod=SHA1)
-    hmac.update(bytes(access_token_secret_bytes))
-    return base64.b64encode(hmac.digest()).decode(STRING_ENCODING)
+    digest = hmac.digest(to_byte_array(K), access_token_secret_bytes, hashlib.sha1)
+    return base64.b64encode(digest).decode(STRING_ENCODING)
 
 
 def validate_live_session_token(
@@ -220,10 +300,11 @@ def validate_live_session_token(
     """
     Validate the calculated live session token against the live session token signature.
     """
-    STRING_ENCODING = "utf-8"
-    hmac = HMAC.new(bytes(base64.b64decode(live_session_token)), digestmod=SHA1)
-    hmac.update(bytes(consumer_key, STRING_ENCODING))
-    calculated_lst_digest = hmac.hexdigest()
+    calculated_lst_digest = hmac.digest(
+        base64.b64decode(live_session_token),
+        consumer_key.encode(STRING_ENCODING),
+        hashlib.sha1,
+    ).hex()
     return calculated_lst_digest == live_session_token_signature
 
 
@@ -233,12 +314,11 @@ def generate_authorization_header_string(request_data: dict, realm: str) -> str:
     key value pairs for the authorization header. The request data is sorted by key and then joined together using the
     character ',' and the string 'OAuth realm=' is prepended to the string. For most cases, the realm is set as limited_poa.
     """
-    HEADER_KEY_VALUE_SEPARATOR = "="
     HEADER_KEY_VALUE_PAIR_SEPARATOR = ", "
     authorization_header_keys = HEADER_KEY_VALUE_PAIR_SEPARATOR.join(
         [
-            f'{key}{HEADER_KEY_VALUE_SEPARATOR}"{value}"'
-            for key, value in sorted(request_data.items())
+            f'{key}="{value}"'
+            for key, value in sorted(request_data.items(), key=operator.itemgetter(0))
         ]
     )
     authorization_header_string = f'OAuth realm="{realm}", {authorization_header_keys}'
@@ -14,12 +14,11 @@ from .oauth_utils import (
     generate_rsa_sha_256_signature,
     generate_base_string,
     generate_authorization_header_string,
-    generate_oauth_nonce,
     generate_dh_challenge,
-    generate_dh_random_bytes,
     calculate_live_session_token,
     calculate_live_session_token_prepend,
     generate_hmac_sha_256_signature,
+    HmacSigner,
     validate_live_session_token,
     OAuthConfig,
     read_and_parse_dh_pem_file,
@@ -553,12 +552,15 @@ class OAuthSession(APISession):
         self.consumer_key = oauth_config.consumer_key
         self.access_token = oauth_config.access_token
         self.access_token_secret = oauth_config.access_token_secret
-        self.dh_prime = read_and_parse_dh_pem_file(oauth_config.dh_param_fp).parameter_numbers().p
+        _, self.dh_prime = read_and_parse_dh_pem_file(oauth_config.dh_param_fp)
         self.realm = oauth_config.realm
         self.live_session_token = live_session_token
         self.live_session_token_expiration = live_session_token_expiry
         self.base_url = "https://api.ibkr.com/v1/api/"
         self.is_test = oauth_config.is_test
+        self.__generate_nonce = oauth_config.nonce
+        self.__generate_dh_random = oauth_config.dh_random
+        self.__hmac_signer = None
 
     def make_api_request(
         self,
@@ -603,7 +605,7 @@ class OAuthSession(APISession):
         ENDPOINT = "oauth/live_session_token"
         REQUEST_METHOD = "POST"
         ENCRYPTION_METHOD = "RSA-SHA256"  # Only for this endpoint, in all other cases use HMAC-SHA256, which is the default.
-        dh_random = generate_dh_random_bytes(self.is_test)
+        dh_random = self.__generate_dh_random()
         dh_challenge = generate_dh_challenge(self.dh_prime, dh_random)
         prepend = calculate_live_session_token_prepend(
             self.access_token_secret, self.encryption_key
@@ -645,7 +647,7 @@ class OAuthSession(APISession):
     def __generate_request_headers(
         self, signature_method: str = "HMAC-SHA256"
     ) -> dict[str, str]:
-        oauth_nonce = generate_oauth_nonce(self.is_test)
+        oauth_nonce = self.__generate_nonce()
         oauth_timestamp = self.__get_utc_timestamp()
         request_headers = {
             "oauth_consumer_key": self.consumer_key,
@@ -691,9 +693,20 @@ class OAuthSession(APISession):
         if encryption_method == "RSA-SHA256":
             signature = generate_rsa_sha_256_signature(base_string, self.signature_key)
         else:
-            signature = generate_hmac_sha_256_signature(base_string, self.live_session_token)
+            signature = generate_hmac_sha_256_signature(base_string, self.__get_hmac_signer())
         return signature
 
+    def __get_hmac_signer(self) -> HmacSigner:
+        """
+        Get the HMAC signer for the current live session token, creating a new one when the token has changed.
+        """
+        if (
+            self.__hmac_signer is None
+            or self.__hmac_signer.live_session_token != self.live_session_token
+        ):
+            self.__hmac_signer = HmacSigner(self.live_session_token)
+        return self.__hmac_signer
+
     @request("POST", "iserver/auth/ssodh/init")
     def init_brokerage_session(
         self, compete: bool = True, publish: bool = True